@@ -1,7 +1,8 @@
+import numpy as np
+
 radius = 0.0125
 
 for k in range(401,501,1):
-    positions = []
 
     home_root = "/srv/home/whu59/research/sbel/"
     file_in = home_root + "d_chrono_fsi_granular/chrono_fsi_granular_102_Rover_Wheel/chrono-dev-io/17/DEMO_OUTPUT/FSI_Rover/Rover/"
@@ -11,116 +12,26 @@ for k in range(401,501,1):
     # filepath_ver = "res_ver_obj_"+str(k)+".obj"
     # filepath_face = "res_fac_obj_"+str(k)+".obj"
     out_mesh = file_out + "fluid"+str(k)+".obj"
-    count = 0
-    for line in open(dir):
-        if count == 0:
-            count = count+1
-            continue
-        else:
-            #you have to parse "x", "y", "z" and "r" from the variable "line"
-            line_seg = line.split(",")
-            x, y, z=line_seg[0],line_seg[1],line_seg[2]
-            position_buff = []
-            position_buff.append(float(x))
-            position_buff.append(float(y))
-            position_buff.append(float(z))
-            positions.append(position_buff)
-            count = count+1
-
-
-    sphere_vertices = []
-    sphere_faces = []
-
-    f = open("sphere_a.obj")
-    for line in f:
-        if line[:2] == "v ":
-            index1 = line.find(" ") + 1
-            index2 = line.find(" ", index1 + 1)
-            index3 = line.find(" ", index2 + 1)
-
-            vertex = (float(line[index1:index2]), float(line[index2:index3]), float(line[index3:-1]))
-            vertex = (round(vertex[0], 2), round(vertex[1], 2), round(vertex[2], 2))
-            sphere_vertices.append(vertex)
-
-        elif line[0] == "f":
-            string = line.replace("//", "/")
-            ##
-            i = string.find(" ") + 1
-            face = []
-            for item in range(string.count(" ")):
-                if string.find(" ", i) == -1:
-                    face.append(int(string[i:-1]))
-                    break
-                face.append(int(string[i:string.find(" ", i)]))
-                i = string.find(" ", i) + 1
-            ##
-            sphere_faces.append(tuple(face))
-
-    f.close()
-
-    sphere_ver_post = []
-    for i in sphere_vertices:
-        buff = []
-        buff.append(float(i[0])*float(radius))
-        buff.append(float(i[1])*float(radius))
-        buff.append(float(i[2])*float(radius))
-        sphere_ver_post.append(buff)
-
-    face_post = []
-    for i in sphere_faces:
-        buff = []
-        buff.append(int(i[0]))
-        buff.append(int(i[1]))
-        buff.append(int(i[2]))
-        face_post.append(buff)
 
+    positions = np.loadtxt(dir, delimiter=',', skiprows=1, usecols=(0, 1, 2), ndmin=2)
 
-    #f_1 = open(filepath_ver, 'w')
-    #f_2 = open(filepath_face, 'w')
-    
-    count_ver = 0
-    count = 0
+    with open("sphere_a.obj") as f:
+        obj_lines = f.read().splitlines()
 
-    tot_ver = []
-    tot_face = []
+    sphere_ver = np.loadtxt([line for line in obj_lines if line[:2] == "v "], usecols=(1, 2, 3), ndmin=2).round(2) * radius
+    sphere_faces = np.loadtxt([line for line in obj_lines if line[:2] == "f "], usecols=(1, 2, 3), dtype=np.int32, ndmin=2)
 
+    # every particle gets its own copy of the sphere, faces offset by the vertices before it
+    n_ver = sphere_ver.shape[0]
+    tot_ver = (sphere_ver[None, :, :] + positions[:, None, :]).reshape(-1, 3)
+    tot_face = (sphere_faces[None, :, :] + (np.arange(positions.shape[0]) * n_ver)[:, None, None]).reshape(-1, 3)
 
-    for i in positions:
-        final_ver = []
-        final_face = []
-        for j in face_post:
-            face_buff = []
-            face_buff.append(count_ver+int(j[0]))
-            face_buff.append(count_ver+int(j[1]))
-            face_buff.append(count_ver+int(j[2]))
-            final_face.append(face_buff)
-        for j in sphere_ver_post:
-            ver_buff = []
-            ver_buff.append(float(j[0])+float(i[0]))
-            ver_buff.append(float(j[1])+float(i[1]))
-            ver_buff.append(float(j[2])+float(i[2]))
-            final_ver.append(ver_buff)
-        count = count+1
-        count_ver = count_ver + int(len(final_ver))
-        for a in range(len(final_ver)):
-            tot_ver.append(final_ver[a])
-            #f_1.write("v "+str(round(final_ver[a][0],5))+" "+str(round(final_ver[a][1],5))+" "+str(round(final_ver[a][2],5))+"\n")
-        
-        for a in range(len(final_face)):
-            tot_face.append(final_face[a])
-            #f_2.write("f "+str(final_face[a][0])+" "+str(final_face[a][1])+" "+str(final_face[a][2])+"\n")
-    
-        del(final_ver)
-        del(final_face)
-    
-    #f_1.close()
-    #f_2.close()
     f_out = open(out_mesh, 'w')
-    for b in range(len(tot_ver)):
-        f_out.write("v "+str(round(tot_ver[b][0],5))+" "+str(round(tot_ver[b][1],5))+" "+str(round(tot_ver[b][2],5))+"\n")
+    for v in tot_ver.tolist():
+        f_out.write("v "+str(round(v[0],5))+" "+str(round(v[1],5))+" "+str(round(v[2],5))+"\n")
 
-    for b in range(len(tot_face)):
-        f_out.write("f "+str(tot_face[b][0])+" "+str(tot_face[b][1])+" "+str(tot_face[b][2])+"\n")
+    for fc in tot_face.tolist():
+        f_out.write("f "+str(fc[0])+" "+str(fc[1])+" "+str(fc[2])+"\n")
 
     f_out.close()
 
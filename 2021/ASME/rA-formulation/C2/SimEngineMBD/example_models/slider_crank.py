@@ -81,10 +81,10 @@ def run_slider_crank(args=None):
     t_steps = int(params.t_end/params.h)
     t_grid = np.linspace(0, params.t_end, t_steps, endpoint=True)
 
-    # (num bodies) x (x, y, z) x (time steps)
-    pos_data = np.zeros((sys.nb, 3, t_steps))
-    vel_data = np.zeros((sys.nb, 3, t_steps))
-    acc_data = np.zeros((sys.nb, 3, t_steps))
+    # (time steps) x (num bodies * (x, y, z)), one contiguous row written per step
+    pos_hist = np.zeros((t_steps, 3*sys.nb))
+    vel_hist = np.zeros((t_steps, 3*sys.nb))
+    acc_hist = np.zeros((t_steps, 3*sys.nb))
 
     crank_rot = np.zeros((t_steps, 3))
 
@@ -98,13 +98,17 @@ def run_slider_crank(args=None):
         # Save stuff for this timestep
         num_iters[i] = sys.k
 
-        for j, body in enumerate(sys.bodies):
-            pos_data[j, :, i] = body.r.T
-            vel_data[j, :, i] = body.dr.T
-            acc_data[j, :, i] = body.ddr.T
+        pos_hist[i] = np.concatenate([body.r for body in sys.bodies]).ravel()
+        vel_hist[i] = np.concatenate([body.dr for body in sys.bodies]).ravel()
+        acc_hist[i] = np.concatenate([body.ddr for body in sys.bodies]).ravel()
 
         crank_rot[i] = sys.bodies[0].ω.T
     Δt = process_time() - start
+
+    # (num bodies) x (x, y, z) x (time steps)
+    pos_data = pos_hist.reshape(t_steps, sys.nb, 3).transpose(1, 2, 0).copy()
+    vel_data = vel_hist.reshape(t_steps, sys.nb, 3).transpose(1, 2, 0).copy()
+    acc_data = acc_hist.reshape(t_steps, sys.nb, 3).transpose(1, 2, 0).copy()
     logging.info('Simulation Ended')
 
     logging.info('Avg. iterations: {}'.format(np.mean(num_iters)))
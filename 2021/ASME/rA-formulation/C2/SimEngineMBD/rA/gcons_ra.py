@@ -7,7 +7,7 @@ See also:   rp.gcons_rp.py, rEps.gcons_reps.py
 """
 
 import numpy as np
-from ..utils.physics import Constraints, skew, I3, check_SO3, generate_sympy_constraint, create_col_slice
+from ..utils.physics import Constraints, skew, I3, check_SO3, generate_sympy_constraint, create_col_slice, get_swap_times
 
 AI = 'a_bar_i'
 AJ = 'a_bar_j'
@@ -479,6 +479,9 @@ class ConGroup:
         self.alt_gcon = None
         self.alt_index = None
 
+        self.swap_times = None
+        self.next_swap = 0
+
         self.init_storage()
 
     def init_storage(self):
@@ -494,12 +497,28 @@ class ConGroup:
 
         self.init_storage()
 
+    def precompute_swaps(self, t_grid):
+        """Determine up front at which times in t_grid maybe_swap_gcons needs to swap in the alternate g-con"""
+
+        if self.alt_gcon is None or self.alt_index is None:
+            return
+
+        self.swap_times = get_swap_times(self.cons[self.alt_index].f, self.alt_gcon.f, t_grid)
+        self.next_swap = 0
+
     def maybe_swap_gcons(self, t):
         """Check if a g-con is close to being singular and if so swap it with the provided alternate"""
 
         if self.alt_gcon is None or self.alt_index is None:
             return
 
+        # Swap times were precomputed, so only check whether we have reached the next one
+        if self.swap_times is not None:
+            if self.next_swap < len(self.swap_times) and t >= self.swap_times[self.next_swap]:
+                self.cons[self.alt_index], self.alt_gcon = self.alt_gcon, self.cons[self.alt_index]
+                self.next_swap += 1
+            return
+
         if np.abs(np.abs(self.cons[self.alt_index].f(t)) - 1) < 0.1:
             self.cons[self.alt_index], self.alt_gcon = self.alt_gcon, self.cons[self.alt_index]
 
@@ -1,10 +1,11 @@
 import logging
 
 import numpy as np
+from numba import njit
 from scipy.linalg import lu_factor, lu_solve
 
 from .gcons_ra import Constraints, DP1, DP2, CD, D, Body, ConGroup
-from ..utils.physics import Z_AXIS, block_mat, R, skew, exp, SolverType
+from ..utils.physics import Z_AXIS, block_mat, R, SolverType
 from ..utils.systems import read_model_file
 
 
@@ -161,16 +162,12 @@ class SystemRA:
         self.k = 0
         while True:
             for j, body in enumerate(self.bodies):
-                body.dr = body.dr_prev + self.h*body.ddr
-                body.ω = body.ω_prev + self.h*body.dω
-
-                body.r = body.r_prev + self.h*body.dr
-                body.A = body.A_prev @ exp(self.h*skew(body.ω))
+                body.dr, body.ω, body.r, body.A, J_term = _update_body(
+                    self.h, body.r_prev, body.A_prev, body.dr_prev, body.ω_prev, body.ddr, body.dω, body.J)
 
                 # Conceptually these go lower, but this way we just loop over bodies once
                 self.ddr[3*j:3*(j + 1)] = body.ddr
-                self.J_term[3*j:3*(j + 1)] = body.J @ body.dω + \
-                    (skew(body.ω) @ body.J @ body.ω)
+                self.J_term[3*j:3*(j + 1)] = J_term
 
             # Compute values needed for the g matrix
             # We can't move this outside the loop since the g_cons
@@ -180,10 +177,7 @@ class SystemRA:
             self.Π = self.g_cons.get_pi(t)
 
             # Form g matrix
-            g0 = self.M @ self.ddr + self.Φ_r.T @ self.λ - self.F_ext
-            g1 = self.J_term + self.Π.T @ self.λ
-            g2 = 1/self.h**2 * self.Φ
-            g = np.block([[g0], [g1], [g2]])
+            g = _form_g(self.h, self.M, self.ddr, self.J_term, self.F_ext, self.Φ, self.Φ_r, self.Π, self.λ)
 
             δ = lu_solve(G_lu, -g)
 
@@ -254,6 +248,65 @@ class SystemRA:
             body.dω = ddq[3*(self.nb + j):3*(self.nb + j+1), :]
 
 
+@njit(cache=True)
+def _update_body(h, r_prev, A_prev, dr_prev, ω_prev, ddr, dω, J):
+    """
+    Takes one body from its previous step values to the current iterate of ddr and dω. Works on the raw arrays so that
+    the Rodrigues update (A_prev @ exp(h*skew(ω))) and the J term do not need a dozen small numpy calls per body
+    """
+    dr = dr_prev + h*ddr
+    ω = ω_prev + h*dω
+    r = r_prev + h*dr
+
+    # Rodrigues' formula for exp(h*skew(ω)), written out with the rotation axis u = ω/|ω|
+    θ = h*np.sqrt(ω[0, 0]**2 + ω[1, 0]**2 + ω[2, 0]**2)
+    rot = np.eye(3)
+    if θ != 0:
+        u = h*ω / θ
+        c = np.cos(θ)
+        s = np.sin(θ)
+        for m in range(3):
+            for n in range(3):
+                rot[m, n] = c*rot[m, n] + (1 - c)*u[m, 0]*u[n, 0]
+        rot[0, 1] -= s*u[2, 0]
+        rot[0, 2] += s*u[1, 0]
+        rot[1, 0] += s*u[2, 0]
+        rot[1, 2] -= s*u[0, 0]
+        rot[2, 0] -= s*u[1, 0]
+        rot[2, 1] += s*u[0, 0]
+    A = A_prev.astype(np.float64) @ rot
+
+    # J dω + ω x (J ω), same as J dω + skew(ω) J ω
+    J = J.astype(np.float64)
+    Jω = J @ ω
+    J_term = J @ dω
+    J_term[0, 0] += ω[1, 0]*Jω[2, 0] - ω[2, 0]*Jω[1, 0]
+    J_term[1, 0] += ω[2, 0]*Jω[0, 0] - ω[0, 0]*Jω[2, 0]
+    J_term[2, 0] += ω[0, 0]*Jω[1, 0] - ω[1, 0]*Jω[0, 0]
+
+    return dr, ω, r, A, J_term
+
+
+@njit(cache=True)
+def _form_g(h, M, ddr, J_term, F_ext, Φ, Φ_r, Π, λ):
+    """
+    Builds the Newton residual g = [M ddr + Φ_r^T λ - F_ext; J_term + Π^T λ; Φ/h²] in a single output vector
+    """
+    n = ddr.shape[0]
+    nc = Φ.shape[0]
+
+    g = np.empty((2*n + nc, 1))
+    g[:n] = M.astype(np.float64) @ ddr - F_ext
+    g[n:2*n] = J_term
+    for i in range(nc):
+        for j in range(n):
+            g[j, 0] += Φ_r[i, j]*λ[i, 0]
+            g[n + j, 0] += Π[i, j]*λ[i, 0]
+        g[2*n + i, 0] = Φ[i, 0] / h**2
+
+    return g
+
+
 def create_constraint_from_bodies(json_con, all_bodies):
     """
     Reads from all_bodies to call create_constraint with appropriate args
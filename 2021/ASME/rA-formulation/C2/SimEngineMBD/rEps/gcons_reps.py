@@ -11,7 +11,7 @@ import warnings as warn
 import numpy as np
 from scipy.spatial.transform import Rotation as Rot
 
-from ..utils.physics import Constraints, skew, generate_sympy_constraint, euler_to_rot
+from ..utils.physics import Constraints, skew, generate_sympy_constraint, euler_to_rot, get_swap_times
 
 AI = 'a_bar_i'
 AJ = 'a_bar_j'
@@ -703,6 +703,9 @@ class ConGroup:
         self.alt_gcon = None
         self.alt_index = None
 
+        self.swap_times = None
+        self.next_swap = 0
+
         self.init_storage()
 
     def init_storage(self):
@@ -718,12 +721,28 @@ class ConGroup:
 
         self.init_storage()
 
+    def precompute_swaps(self, t_grid):
+        """Determine up front at which times in t_grid maybe_swap_gcons needs to swap in the alternate g-con"""
+
+        if self.alt_gcon is None or self.alt_index is None:
+            return
+
+        self.swap_times = get_swap_times(self.cons[self.alt_index].f, self.alt_gcon.f, t_grid)
+        self.next_swap = 0
+
     def maybe_swap_gcons(self, t):
         """Check if a g-con is close to being singular and if so swap it with the provided alternate"""
 
         if self.alt_gcon is None or self.alt_index is None:
             return
 
+        # Swap times were precomputed, so only check whether we have reached the next one
+        if self.swap_times is not None:
+            if self.next_swap < len(self.swap_times) and t >= self.swap_times[self.next_swap]:
+                self.cons[self.alt_index], self.alt_gcon = self.alt_gcon, self.cons[self.alt_index]
+                self.next_swap += 1
+            return
+
         if np.abs(np.abs(self.cons[self.alt_index].f(t)) - 1) < 0.1:
             self.cons[self.alt_index], self.alt_gcon = self.alt_gcon, self.cons[self.alt_index]
 
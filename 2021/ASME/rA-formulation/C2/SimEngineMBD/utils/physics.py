@@ -2,6 +2,7 @@ import logging
 
 import numpy as np
 import sympy as sp
+from numba import njit
 from enum import Enum, auto
 from collections import namedtuple
 
@@ -113,7 +114,24 @@ def skew(v):
         v = check_vector(v, 3)
 
     # NOTE: Using np.cross is significantly slower than this version, despite the aesthetic appeal
-    return np.array([[0, -v[2, 0], v[1, 0]], [v[2, 0], 0, -v[0, 0]], [-v[1, 0], v[0, 0], 0]])
+    return _skew(v)
+
+
+@njit(cache=True)
+def _skew(v):
+    """
+    Compiled body of skew, filling the matrix entry by entry is cheaper than building it from nested lists
+    """
+    ṽ = np.zeros((3, 3))
+
+    ṽ[0, 1] = -v[2, 0]
+    ṽ[0, 2] = v[1, 0]
+    ṽ[1, 0] = v[2, 0]
+    ṽ[1, 2] = -v[0, 0]
+    ṽ[2, 0] = -v[1, 0]
+    ṽ[2, 1] = v[0, 0]
+
+    return ṽ
 
 
 def A(p):
@@ -303,6 +321,23 @@ def generate_sympy_constraint(f_sym, var):
 
     return (f, df, ddf)
 
+def get_swap_times(f, f_alt, t_grid):
+    """
+    Finds the times in t_grid at which a driving constraint f gets swapped with its alternate f_alt, i.e. whenever the
+    active one is close to singular (|f| ≈ 1). Both functions are evaluated over the whole grid at once so that nothing
+    has to be evaluated during the time stepping
+    """
+    near_singular = [np.abs(np.abs(np.broadcast_to(fn(t_grid), np.shape(t_grid))) - 1) < 0.1 for fn in (f, f_alt)]
+
+    swap_times = []
+    active = 0
+    for i in np.flatnonzero(near_singular[0] | near_singular[1]):
+        if near_singular[active][i]:
+            swap_times.append(t_grid[i])
+            active = 1 - active
+
+    return np.array(swap_times)
+
 def create_col_slice(i_id, j_id, dim):
     """
     Creates a NumPy multi-slice object representing the columns in the global Φ_r, Π_* arrays at which a particular
@@ -1,3 +1,4 @@
+import itertools
 import pickle
 from multiprocessing import Pool
 import os
@@ -12,71 +13,83 @@ from SimEngineMBD.example_models.slider_crank import time_slider_crank
 
 dir_path = './output/timing_surface/'
 
-def save_data():
+# For 'production'
+# step_sizes = np.array([1e-3, 2e-3, 4e-3, 8e-3, 1e-2, 2e-2, 4e-2, 8e-2, 1e-1])
+# M_vals = np.array([1e-8, 1e-9, 1e-10, 1e-11, 1e-12, 1e-13])
 
-    # For 'production'
-    # step_sizes = np.array([1e-3, 2e-3, 4e-3, 8e-3, 1e-2, 2e-2, 4e-2, 8e-2, 1e-1])
-    # M_vals = np.array([1e-8, 1e-9, 1e-10, 1e-11, 1e-12, 1e-13])
+# # For testing
+step_sizes = np.array([2e-2, 4e-2, 8e-2])
+M_vals = np.array([1e-8, 1e-9])
 
-    # # For testing
-    step_sizes = np.array([2e-2, 4e-2, 8e-2])
-    M_vals = np.array([1e-8, 1e-9])
+end_time = 3
+timing_runs = 5
 
-    end_time = 3
-    timing_runs = 5
+pretty_form = {'rp': 'rp', 'rA': 'rA', 'reps': 'rε'}
 
-    pretty_form = {'rp': 'rp', 'rA': 'rA', 'reps': 'rε'}
+def get_pretty_name(model_fn):
+    # time_some_model_name -> Some_Model_Name
+    return '_'.join([word.capitalize() for word in model_fn.__name__[5:].split('_')])
 
-    ss, MM = np.meshgrid(step_sizes, M_vals)
-    with open(dir_path + 'mesh_params.pickle', 'wb') as handle:
-        pickle.dump((ss, MM), handle, protocol=pickle.HIGHEST_PROTOCOL)
+def run_timing(args):
+    """
+    Times a single (form, model, M, step) run, returning NaN if the run fails so it doesn't get plotted
+    """
+    form, model_fn, M, step = args
 
-    def run_model(args):
-        form, model_fn = args
+    warnings.filterwarnings('error')
+    tol = M / step**2
 
-        # time_some_model_name -> Some_Model_Name
-        pretty_name = '_'.join([word.capitalize() for word in model_fn.__name__[5:].split('_')])
+    try:
+        return model_fn(['--form', form, '--mode', 'dynamics', '--tol', str(tol), '--step_size', str(step), '--end_time', str(end_time)])
+    except RuntimeError:
+        print('{}-{}, step: {}, tol: {} failed to converge'.format(form, get_pretty_name(model_fn), str(step), str(tol)))
+    except RuntimeWarning:
+        print('{}-{}, step: {}, tol: {} overflowed'.format(form, get_pretty_name(model_fn), str(step), str(tol)))
 
-        timing = np.full((len(M_vals), len(step_sizes)), np.nan)
+    return np.nan
 
-        for i, M in enumerate(M_vals):
-            for j, step in enumerate(step_sizes):
-                warnings.filterwarnings('error')
-                try:
-                    times = np.zeros(timing_runs)
-                    tol = M / step**2
+def save_data():
+
+    ss, MM = np.meshgrid(step_sizes, M_vals)
+    with open(dir_path + 'mesh_params.pickle', 'wb') as handle:
+        pickle.dump((ss, MM), handle, protocol=pickle.HIGHEST_PROTOCOL)
 
-                    for k in range(0, timing_runs):
-                        Δt = model_fn(['--form', form, '--mode', 'dynamics', '--tol', str(tol), '--step_size', str(step), '--end_time', str(end_time)])
-                        times[k] = Δt
+    model_fns = [time_single_pendulum, time_four_link, time_slider_crank]
+    forms = ['rp', 'reps', 'rA']
 
-                    timing[i, j] = np.mean(times) / end_time
+    # Every timing run is independent, so flatten the whole sweep and let the pool balance it
+    sweep = list(itertools.product(model_fns, forms, M_vals, step_sizes))
+    tasks = [(form, model_fn, M, step) for model_fn, form, M, step in sweep for _ in range(timing_runs)]
 
-                except RuntimeError:
-                    print('{}-{}, step: {}, tol: {} failed to converge'.format(form, pretty_name, str(step), str(tol)))
-                except RuntimeWarning:
-                    print('{}-{}, step: {}, tol: {} overflowed'.format(form, pretty_name, str(step), str(tol)))
+    # Fill one preallocated array as results come in rather than building a list and converting it afterwards
+    num_procs = os.cpu_count()
+    with Pool(num_procs) as pool:
+        times = np.fromiter(pool.imap(run_timing, tasks, chunksize=max(1, len(tasks) // (4*num_procs))),
+                            dtype=np.float64, count=len(tasks))
 
-        save_name = '{}_{}_timing.pickle'.format(pretty_name, form)
-        info = (pretty_name, pretty_form[form])
+    times = times.reshape((len(sweep), timing_runs))
 
-        with open(dir_path + save_name, 'wb') as handle:
-            pickle.dump((info, timing), handle, protocol=pickle.HIGHEST_PROTOCOL)
+    # Keep the raw parameter -> run times mapping around for post-processing
+    sweep_results = {(get_pretty_name(model_fn), form, M, step): times[n]
+                     for n, (model_fn, form, M, step) in enumerate(sweep)}
+    with open(dir_path + 'sweep_results.pickle', 'wb') as handle:
+        pickle.dump(sweep_results, handle, protocol=pickle.HIGHEST_PROTOCOL)
 
-        print('Completed {} {} Analysis'.format(pretty_name, pretty_form[form]))
+    # A single failed run leaves NaN for the whole (M, step) entry
+    times = times.reshape((len(model_fns), len(forms), len(M_vals), len(step_sizes), timing_runs))
+    timings = times.sum(axis=-1) * (1 / (timing_runs*end_time))
 
-    tasks = []
+    for a, model_fn in enumerate(model_fns):
+        pretty_name = get_pretty_name(model_fn)
 
-    for model_fn in [time_single_pendulum, time_four_link, time_slider_crank]:
-        for form in ['rp', 'reps', 'rA']:
-            tasks.append((form, model_fn))
+        for b, form in enumerate(forms):
+            save_name = '{}_{}_timing.pickle'.format(pretty_name, form)
+            info = (pretty_name, pretty_form[form])
 
-    # for task in tasks:
-    #     run_model(task)
+            with open(dir_path + save_name, 'wb') as handle:
+                pickle.dump((info, timings[a, b]), handle, protocol=pickle.HIGHEST_PROTOCOL)
 
-    pool = Pool()
-    pool.map(run_model, tasks)
-    pool.close()
+            print('Completed {} {} Analysis'.format(pretty_name, pretty_form[form]))
 
 def generate_plots():
 
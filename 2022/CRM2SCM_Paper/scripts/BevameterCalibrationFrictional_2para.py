@@ -17,6 +17,7 @@ import scipy.io as sio
 import matplotlib.pyplot as plt
 import ctypes
 from numpy.ctypeslib import ndpointer
+from numba import njit
 import pymc3 as pm
 import arviz as az
 import theano
@@ -25,6 +26,8 @@ import pychrono.core as chrono
 import pychrono.vehicle as veh
 import time
 import math
+import os
+import functools
 import random
 
 # =============================================================================
@@ -98,38 +101,69 @@ Post = out_dir + direction + "Post_" + num_chains + num_steps + sigma_val + ".pn
 fig_size = [10, 5]
 text_size = 14.0
 
-def F1(x, nSims):
-    func_out = []
-    for i in range(nSims):
-        # read the mass
-        mass = input_data[i] / data_rescale[0]
-
-        # get the cohesion
-        c_coh = x[0] * x_rescale[0]
-
-        # get the frictional angle
-        fri_ang = x[1] * x_rescale[1] * math.pi / 180.0
-
-        # calculate the force arm length
-        L = (plate_rad + plate_rad_in) / 2.0
-
-        # calculate the torque
-        T = c_coh * plate_area * L + mass * 9.81 * L * math.tan(fri_ang)
-        T = T * data_rescale[1]
-
-        func_out.append(T)
-        # print("[", x[0], ",", x[1], " ", z, ",", P, ",", F, ",", obsData[i][4], "]")
-        
-    return np.array(func_out)
-
-def likelihood_func(cali_param, data, sigma):
+# Constant part of the torque model, F1 only has to scale these by the parameters
+# read the mass
+mass_arr = input_data / data_rescale[0]
+# calculate the force arm length
+L = (plate_rad + plate_rad_in) / 2.0
+# torque per unit cohesion and per unit tan(frictional angle)
+k_coh = plate_area * L * data_rescale[1]
+k_mass = 9.81 * L * data_rescale[1] * mass_arr
+
+# tan(x) = x * P(x^2) on [0, pi/4], fitted once here; larger angles use tan(x) = 1/tan(pi/2 - x)
+tan_x = np.linspace(0.0, math.pi / 4.0, 2001)[1:]
+tan_coef = np.polynomial.Chebyshev.fit(tan_x**2, np.tan(tan_x) / tan_x, 10).convert(kind=np.polynomial.Polynomial).coef[::-1].copy()
+
+@njit(cache=True, fastmath=True)
+def _tan_fast(x, coef):
+    # fall back to math.tan outside of the prior's [0, 90) degrees
+    if x < 0.0 or x >= math.pi / 2.0:
+        return math.tan(x)
+    flip = x > math.pi / 4.0
+    if flip:
+        x = math.pi / 2.0 - x
+    # Horner's scheme in x^2
+    x2 = x * x
+    p = 0.0
+    for c in coef:
+        p = p * x2 + c
+    if flip:
+        return 1.0 / (x * p)
+    return x * p
+
+@njit(cache=True, fastmath=True)
+def _f1_core(c_coh, fri_ang, k_coh, k_mass, tan_coef):
+    # calculate the torque at every load
+    return k_coh * c_coh + k_mass * _tan_fast(fri_ang, tan_coef)
+
+@njit(cache=True, fastmath=True)
+def _loglike_core(model_output, data, scale):
+    diff = model_output - data
+    return - scale * np.sum(diff * diff)
+
+def F1(x):
+    # get the cohesion
+    c_coh = x[0] * x_rescale[0]
+
+    # get the frictional angle
+    fri_ang = x[1] * x_rescale[1] * math.pi / 180.0
+
+    return _f1_core(c_coh, fri_ang, k_coh, k_mass, tan_coef)
+
+# Metropolis evaluates the likelihood at both the proposal and the current point on every step,
+# so the current point is seen over and over again while the chain sits on it
+@functools.lru_cache(maxsize=1024)
+def F1_cached(x0, x1):
+    return F1((x0, x1))
+
+def likelihood_func(cali_param, data, loglike_scale):
     # t = time.time()
     # model_output = F(cali_param, nSims)
-    model_output = F1(cali_param, nSims)
+    model_output = F1_cached(float(cali_param[0]), float(cali_param[1]))
     # elapsed = time.time() - t
     # print(f"One sim time: {elapsed:f}")
-    return_value = - (0.5 / sigma**2) * np.sum((model_output - data[:nSims])**2) / nSims
-    print("cali_param and return_value = ", cali_param[0], cali_param[1], return_value)
+    return_value = _loglike_core(model_output, data, loglike_scale)
+    # print("cali_param and return_value = ", cali_param[0], cali_param[1], return_value)
     return return_value
 
 def main():
@@ -160,7 +194,8 @@ def main():
         step = pm.Metropolis(vars=[x1,x2])
 
         tic = time.perf_counter()
-        trace = pm.sample(nsteps, tune=nsteps//(nchains+1), chains=nchains, step=step, 
+        trace = pm.sample(nsteps, tune=nsteps//(nchains+1), chains=nchains, step=step,
+                          cores=min(nchains, os.cpu_count()),
                           discard_tuned_samples=True, return_inferencedata=True,
                           start={coh:iniGuess[0], phi:iniGuess[1]})
                           # start={'x':[0.8, 0.9]})
@@ -213,17 +248,19 @@ class LogLike(tt.Op):
 
         # add inputs as class attributes
         self.likelihood = loglike
-        self.data = data
+        self.data = data[:nSims]
         self.sigma = sigma
+        # the likelihood's scale only depends on sigma, so compute it once instead of every draw
+        self.loglike_scale = 0.5 / (sigma**2 * nSims)
 
     def perform(self, node, inputs, outputs):
         # the method that is used when calling the Op
         theta, = inputs  # this will contain my variables
  
         # call the log-likelihood function
-        logl = self.likelihood(theta, self.data, self.sigma)
+        logl = self.likelihood(theta, self.data, self.loglike_scale)
 
-        outputs[0][0] = np.array(logl) # output the log-likelihood
+        outputs[0][0] = np.float64(logl) # output the log-likelihood
 
 
 if __name__ == "__main__":
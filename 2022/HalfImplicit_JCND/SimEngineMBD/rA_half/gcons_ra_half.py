@@ -6,7 +6,11 @@ Used by:    system_ra_half.py
 See also:   rp.gcons_rp.py, rEps.gcons_reps.py
 """
 
+from operator import attrgetter
+
 import numpy as np
+from numba import njit
+from scipy.sparse import csr_matrix
 from ..utils.physics import Constraints, skew, I3, check_SO3, generate_sympy_constraint, create_col_slice
 
 AI = 'a_bar_i'
@@ -23,6 +27,11 @@ JS_A = "A"
 JS_omega = "omega"
 
 
+def undriven(t):
+    """Default f, f_dot and f_ddot of a gcon that has no driving function"""
+    return 0
+
+
 def distance_fn(body_i, body_j, si, sj):
     """
     d_ij in Haug and Negrut's notation
@@ -32,24 +41,64 @@ def distance_fn(body_i, body_j, si, sj):
     return body_j.r + body_j.A @ sj - body_i.r - body_i.A @ si
 
 
+class BodyArrays:
+    """
+    Struct-of-arrays storage for the state and inertial properties of nb bodies, row j belongs to body j. Vectors are
+    kept as (nb, 3, 1) stacks of column vectors and matrices as (nb, 3, 3), so reshape(-1, 1) gives the stacked system
+    vector without a copy
+    """
+
+    vectors = ('r', 'dr', 'ddr', 'ω', 'dω', 'r_prev', 'dr_prev', 'ω_prev', 'F', 'n_ω')
+    matrices = ('A', 'A_prev', 'J', 'J_inv')
+
+    def __init__(self, nb):
+        self.nb = nb
+
+        for name in self.vectors:
+            setattr(self, name, np.zeros((nb, 3, 1)))
+        for name in self.matrices:
+            setattr(self, name, np.zeros((nb, 3, 3)))
+
+        self.A[:] = I3
+        self.A_prev[:] = I3
+        self.m = np.zeros(nb)
+
+    def cache_rA_values(self):
+        """Body.cache_rA_values for all bodies at once"""
+        np.copyto(self.r_prev, self.r)
+        np.copyto(self.A_prev, self.A)
+        np.copyto(self.dr_prev, self.dr)
+        np.copyto(self.ω_prev, self.ω)
+
+
+def _body_field(name):
+    """
+    Body attribute backed by the body's row of its BodyArrays, reads give a view and writes copy into the row
+    """
+    view_name = '_' + name + '_view'
+
+    def fset(body, value):
+        getattr(body, view_name)[...] = value
+
+    return property(attrgetter(view_name), fset)
+
+
 class Body:
     def __init__(self, r, dr, A, ω, is_ground):
         self.is_ground = is_ground
         self.id = None  # Assigned later for non-ground bodies
 
+        # A body keeps its own single row of storage until a system binds it to shared arrays
+        self.bind(BodyArrays(1), 0)
+
         self.r = r
         self.dr = dr
-        self.ddr = np.zeros((3,1), dtype=float)
-        self.dω = np.zeros((3,1), dtype=float)
 
         self.A = A
         self.ω = ω
 
-        self.m = 0
         self.V = 0
         self.J = np.zeros((3, 3))
-        self.F = np.zeros((3, 1))
-        self.n_ω = np.zeros((3, 1))  # external torque?
 
         self.r_prev = self.r
         self.A_prev = self.A
@@ -77,6 +126,28 @@ class Body:
 
         return cls(r, dr, A, ω, is_ground)
 
+    def bind(self, arrays, row):
+        """Moves the body's values into row `row` of arrays, from then on all reads and writes go through that row"""
+
+        if hasattr(self, '_arrays'):
+            for name in BodyArrays.vectors + BodyArrays.matrices + ('m',):
+                getattr(arrays, name)[row] = getattr(self._arrays, name)[self._row]
+
+        self._arrays = arrays
+        self._row = row
+
+        for name in BodyArrays.vectors + BodyArrays.matrices:
+            setattr(self, '_' + name + '_view', getattr(arrays, name)[row])
+
+    @property
+    def m(self):
+        """Body's mass"""
+        return self._arrays.m[self._row]
+
+    @m.setter
+    def m(self, value):
+        self._arrays.m[self._row] = value
+
     def cache_rA_values(self):
         self.r_prev = self.r
         self.A_prev = self.A
@@ -84,7 +155,7 @@ class Body:
         self.ω_prev = self.ω
 
     def get_tau(self):
-        return -self.ω_tilde @ self.J @ self.ω
+        return -np.cross(self.ω, self.J @ self.ω, axis=0)
 
     def get_J_term(self, h):
         # NOTE: h**2 terms dropped for now
@@ -94,17 +165,11 @@ class Body:
     @property
     def ω_tilde(self):
         """Returns cross product of ω, ω_tilde = skew(ω) """
-        return self._ω_tilde
+        return skew(self.ω)
 
-    @property
-    def ω(self):
-        """Body's angular velocity"""
-        return self._ω
 
-    @ω.setter
-    def ω(self, value):
-        self._ω_tilde = skew(value)
-        self._ω = value
+for _name in BodyArrays.vectors + BodyArrays.matrices:
+    setattr(Body, _name, _body_field(_name))
 
 
 class DP1:
@@ -120,9 +185,9 @@ class DP1:
         self.ai = ai
         self.aj = aj
 
-        self.f = lambda t: 0
-        self.df = lambda t: 0
-        self.ddf = lambda t: 0
+        self.f = undriven
+        self.df = undriven
+        self.ddf = undriven
 
         self.col_slice = create_col_slice(self.body_i.id, self.body_j.id, 3)
 
@@ -216,9 +281,9 @@ class DP2:
         self.si = si
         self.sj = sj
 
-        self.f = lambda t: 0
-        self.df = lambda t: 0
-        self.ddf = lambda t: 0
+        self.f = undriven
+        self.df = undriven
+        self.ddf = undriven
 
         self.col_slice = create_col_slice(self.body_i.id, self.body_j.id, 3)
 
@@ -296,9 +361,9 @@ class D:
         self.si = si
         self.sj = sj
 
-        self.f = lambda t: 0
-        self.df = lambda t: 0
-        self.ddf = lambda t: 0
+        self.f = undriven
+        self.df = undriven
+        self.ddf = undriven
 
         self.col_slice = create_col_slice(self.body_i.id, self.body_j.id, 3)
 
@@ -395,9 +460,9 @@ class CD:
 
         self.c = c
 
-        self.f = lambda t: 0
-        self.df = lambda t: 0
-        self.ddf = lambda t: 0
+        self.f = undriven
+        self.df = undriven
+        self.ddf = undriven
 
         self.col_slice = create_col_slice(self.body_i.id, self.body_j.id, 3)
 
@@ -483,6 +548,9 @@ class ConGroup:
         self.alt_index = None
         self.init_storage()
 
+        # Per gcon type SoA blocks for the compiled kernels, set up by pack()
+        self.packed = None
+
     def init_storage(self):
         self.Φ = np.zeros((self.nc, 1))
         self.Φr = np.zeros((self.nc, 3*self.nb))
@@ -490,22 +558,91 @@ class ConGroup:
         self.γ = np.zeros((self.nc, 1))
         self.nu = np.zeros((self.nc, 1))
 
+        # Each gcon touches at most two bodies, so the (row, col) pattern of Φ_r and Π is fixed by the gcons and only
+        # the values change. Keep the nonzeros in flat buffers, with one slice of them per gcon
+        self.sp_rows = np.array([i for i, con in enumerate(self.cons) for _ in con.col_slice], dtype=int)
+        self.sp_cols = np.array([col for con in self.cons for col in con.col_slice], dtype=int)
+
+        ends = np.cumsum([len(con.col_slice) for con in self.cons], dtype=int)
+        self.sp_slices = [slice(end - len(con.col_slice), end) for con, end in zip(self.cons, ends)]
+
+        self.Φr_data = np.zeros(len(self.sp_cols))
+        self.Π_data = np.zeros(len(self.sp_cols))
+
     def add_constraint(self, con):
         self.cons.append(con)
         self.nc = len(self.cons)
 
         self.init_storage()
+        self.packed = None
+
+    def pack(self):
+        """
+        Partitions the gcons by type into SoA arrays of body rows and body-fixed vectors, so that Φ, Φ_r and Π can be
+        evaluated by one compiled kernel call per gcon type instead of per gcon. The bodies must already be bound to their
+        system's BodyArrays. Gcon vectors and driving functions are read here, so call this again after changing them
+        """
+        bodies = [body for con in self.cons for body in (con.body_i, con.body_j) if not body.is_ground]
+        self.body_arrays = bodies[0]._arrays
+        assert all(body._arrays is self.body_arrays for body in bodies), "All bodies must share one BodyArrays"
+
+        def row(body):
+            return -1 if body.is_ground else body._row
+
+        self.packed = []
+        for cons_type, kernel, fields in _KERNELS:
+            idx = [k for k, con in enumerate(self.cons) if con.cons_type == cons_type]
+            if not idx:
+                continue
+
+            cons = [self.cons[k] for k in idx]
+            vectors = tuple(np.array([getattr(con, field).reshape(3) for con in cons], dtype=np.float64)
+                            for field in fields)
+            rows_i = np.array([row(con.body_i) for con in cons])
+            rows_j = np.array([row(con.body_j) for con in cons])
+
+            self.packed.append((kernel, (np.array(idx), rows_i, rows_j) + vectors))
+
+        # Only driven gcons need f(t) evaluated
+        self.driven = [k for k, con in enumerate(self.cons) if con.f is not undriven]
+
+        # Kernels write the i and j blocks of every Φ_r and Π row, these pick out the ones belonging to non-ground
+        # bodies in the same order as sp_rows/sp_cols
+        self.Φr_blocks = np.zeros((self.nc, 2, 3))
+        self.Π_blocks = np.zeros((self.nc, 2, 3))
+        self.block_src = np.array([6*k + 3*side + n for k, con in enumerate(self.cons)
+                                   for side, body in enumerate((con.body_i, con.body_j)) if not body.is_ground
+                                   for n in range(3)], dtype=int)
+
+    def eval_packed(self, jacobians):
+        """Runs the compiled kernels, filling Φ without the driving functions and, if asked, the Φ_r and Π blocks"""
+        for kernel, args in self.packed:
+            kernel(*args, self.body_arrays.r, self.body_arrays.A, self.Φ, self.Φr_blocks, self.Π_blocks, jacobians)
 
     def maybe_swap_gcons(self, t):
-        """Check if a g-con is close to being singular and if so swap it with the provided alternate"""
+        """
+        Check if a g-con is close to being singular and if so swap it with the provided alternate. Returns whether a swap
+        happened
+        """
 
         if self.alt_gcon is None or self.alt_index is None:
-            return
+            return False
 
         if np.abs(np.abs(self.cons[self.alt_index].f(t)) - 1) < 0.1:
             self.cons[self.alt_index], self.alt_gcon = self.alt_gcon, self.cons[self.alt_index]
+            if self.packed is not None:
+                self.pack()
+            return True
+
+        return False
 
     def get_phi(self, t):
+        if self.packed is not None:
+            self.eval_packed(False)
+            for i in self.driven:
+                self.Φ[i, 0] -= self.cons[i].f(t)
+            return self.Φ
+
         for i, con in enumerate(self.cons):
             self.Φ[i, 0] = con.get_phi(t)
         return self.Φ
@@ -521,6 +658,11 @@ class ConGroup:
         return self.nu
 
     def get_phi_r(self, t):
+        if self.packed is not None:
+            self.eval_packed(True)
+            self.Φr[self.sp_rows, self.sp_cols] = self.Φr_blocks.reshape(-1)[self.block_src]
+            return self.Φr
+
         for i, con in enumerate(self.cons):
             self.Φr[i, con.col_slice] = con.get_phi_r(t)
             # for b_id, phiR in con.get_phi_r(t):
@@ -528,11 +670,142 @@ class ConGroup:
         return self.Φr
 
     def get_pi(self, t):
+        if self.packed is not None:
+            self.eval_packed(True)
+            self.Π[self.sp_rows, self.sp_cols] = self.Π_blocks.reshape(-1)[self.block_src]
+            return self.Π
+
         for i, con in enumerate(self.cons):
             self.Π[i, con.col_slice] = con.get_pi(t)
             # for b_id, Π in con.get_pi(t):
             #     self.Π[i, 3*b_id:3*(b_id + 1)] = Π
         return self.Π
 
+    def get_phi_r_sparse(self, t):
+        if self.packed is not None:
+            self.eval_packed(True)
+            self.Φr_data[:] = self.Φr_blocks.reshape(-1)[self.block_src]
+            return csr_matrix((self.Φr_data, (self.sp_rows, self.sp_cols)), shape=(self.nc, 3*self.nb))
+
+        for sp_slice, con in zip(self.sp_slices, self.cons):
+            self.Φr_data[sp_slice] = con.get_phi_r(t)
+        return csr_matrix((self.Φr_data, (self.sp_rows, self.sp_cols)), shape=(self.nc, 3*self.nb))
+
+    def get_pi_sparse(self, t):
+        if self.packed is not None:
+            self.eval_packed(True)
+            self.Π_data[:] = self.Π_blocks.reshape(-1)[self.block_src]
+            return csr_matrix((self.Π_data, (self.sp_rows, self.sp_cols)), shape=(self.nc, 3*self.nb))
+
+        for sp_slice, con in zip(self.sp_slices, self.cons):
+            self.Π_data[sp_slice] = con.get_pi(t)
+        return csr_matrix((self.Π_data, (self.sp_rows, self.sp_cols)), shape=(self.nc, 3*self.nb))
+
     def get_phi_q(self, t):
         return np.concatenate((self.get_phi_r(t), self.get_pi(t)), axis=1)
+
+
+@njit(cache=True)
+def _body_r(r, b):
+    """Position of body row b as a flat 3-vector, row -1 is the ground"""
+    out = np.zeros(3)
+    if b >= 0:
+        for m in range(3):
+            out[m] = r[b, m, 0]
+    return out
+
+
+@njit(cache=True)
+def _body_A(A, b):
+    """Orientation of body row b, row -1 is the ground"""
+    if b < 0:
+        return np.eye(3)
+    return A[b]
+
+
+@njit(cache=True)
+def _cross(a, b):
+    """a × b, which is also the row vector aᵀ skew(b)"""
+    return np.array([a[1]*b[2] - a[2]*b[1], a[2]*b[0] - a[0]*b[2], a[0]*b[1] - a[1]*b[0]])
+
+
+@njit(cache=True)
+def _dp1_kernel(rows, bi, bj, ai, aj, r, A, Φ, Φr_blocks, Π_blocks, jacobians):
+    """Batched DP1.get_phi (without f), get_phi_r and get_pi"""
+    for k in range(rows.shape[0]):
+        Ai = _body_A(A, bi[k])
+        Aj = _body_A(A, bj[k])
+        Ai_ai = Ai @ ai[k]
+        Aj_aj = Aj @ aj[k]
+
+        c = rows[k]
+        Φ[c, 0] = Ai_ai @ Aj_aj
+
+        if jacobians:
+            Φr_blocks[c, :, :] = 0
+            Π_blocks[c, 0] = _cross(-(Ai.T @ Aj_aj), ai[k])
+            Π_blocks[c, 1] = _cross(-(Aj.T @ Ai_ai), aj[k])
+
+
+@njit(cache=True)
+def _dp2_kernel(rows, bi, bj, ai, si, sj, r, A, Φ, Φr_blocks, Π_blocks, jacobians):
+    """Batched DP2.get_phi (without f), get_phi_r and get_pi"""
+    for k in range(rows.shape[0]):
+        Ai = _body_A(A, bi[k])
+        Aj = _body_A(A, bj[k])
+        d_ij = _body_r(r, bj[k]) + Aj @ sj[k] - _body_r(r, bi[k]) - Ai @ si[k]
+        Ai_ai = Ai @ ai[k]
+
+        c = rows[k]
+        Φ[c, 0] = Ai_ai @ d_ij
+
+        if jacobians:
+            Φr_blocks[c, 0] = -Ai_ai
+            Φr_blocks[c, 1] = Ai_ai
+            Π_blocks[c, 0] = _cross(ai[k], si[k]) - _cross(Ai.T @ d_ij, ai[k])
+            Π_blocks[c, 1] = _cross(-(Aj.T @ Ai_ai), sj[k])
+
+
+@njit(cache=True)
+def _d_kernel(rows, bi, bj, si, sj, r, A, Φ, Φr_blocks, Π_blocks, jacobians):
+    """Batched D.get_phi (without f), get_phi_r and get_pi"""
+    for k in range(rows.shape[0]):
+        Ai = _body_A(A, bi[k])
+        Aj = _body_A(A, bj[k])
+        d_ij = _body_r(r, bj[k]) + Aj @ sj[k] - _body_r(r, bi[k]) - Ai @ si[k]
+
+        c = rows[k]
+        Φ[c, 0] = d_ij @ d_ij
+
+        if jacobians:
+            Φr_blocks[c, 0] = -2*d_ij
+            Φr_blocks[c, 1] = 2*d_ij
+            Π_blocks[c, 0] = _cross(2*(Ai.T @ d_ij), si[k])
+            Π_blocks[c, 1] = _cross(-2*(Aj.T @ d_ij), sj[k])
+
+
+@njit(cache=True)
+def _cd_kernel(rows, bi, bj, si, sj, c_vec, r, A, Φ, Φr_blocks, Π_blocks, jacobians):
+    """Batched CD.get_phi (without f), get_phi_r and get_pi"""
+    for k in range(rows.shape[0]):
+        Ai = _body_A(A, bi[k])
+        Aj = _body_A(A, bj[k])
+        d_ij = _body_r(r, bj[k]) + Aj @ sj[k] - _body_r(r, bi[k]) - Ai @ si[k]
+
+        c = rows[k]
+        Φ[c, 0] = c_vec[k] @ d_ij
+
+        if jacobians:
+            Φr_blocks[c, 0] = -c_vec[k]
+            Φr_blocks[c, 1] = c_vec[k]
+            Π_blocks[c, 0] = _cross(Ai.T @ c_vec[k], si[k])
+            Π_blocks[c, 1] = _cross(-(Aj.T @ c_vec[k]), sj[k])
+
+
+# gcon type, its kernel and the body-fixed vectors the kernel takes, in order
+_KERNELS = [
+    (Constraints.DP1, _dp1_kernel, ('ai', 'aj')),
+    (Constraints.DP2, _dp2_kernel, ('ai', 'si', 'sj')),
+    (Constraints.D, _d_kernel, ('si', 'sj')),
+    (Constraints.CD, _cd_kernel, ('si', 'sj', 'c')),
+]
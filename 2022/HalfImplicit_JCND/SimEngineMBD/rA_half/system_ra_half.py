@@ -1,12 +1,23 @@
 import logging
+import warnings
 
 import numpy as np
-from scipy.linalg import lu_factor, lu_solve
-
-from .gcons_ra_half import Constraints, DP1, DP2, CD, D, Body, ConGroup
-from ..utils.physics import Z_AXIS, block_mat, R, skew, exp, SolverType
+from numba import njit, prange
+from scipy.linalg import LinAlgWarning
+from scipy.linalg.lapack import dgetrf, dgetrs, dpotrf
+from scipy.sparse import block_diag, issparse
+from scipy.sparse.linalg import splu, norm as sparse_norm
+
+from .gcons_ra_half import Constraints, DP1, DP2, CD, D, Body, BodyArrays, ConGroup
+from ..utils.physics import Z_AXIS, block_mat, skew_batched, rodrigues_batch, SolverType
 from ..utils.systems import read_model_file
 
+# From this many bodies on Φ_r and Π are mostly zeros, and the sparse solve beats the dense one
+SPARSE_MIN_BODIES = 40
+
+# Pivots of a Cholesky factored Schur complement, which has none
+_NO_PIVOTS = np.empty(0, dtype=np.int32)
+
 
 class SystemRA_half:
 
@@ -22,8 +33,15 @@ class SystemRA_half:
 
         assert self.nb == len(self.bodies), "Mismatch on number of bodies"
 
+        # All bodies keep their state in one set of (nb, 3, 1) and (nb, 3, 3) arrays so we can work on them at once
+        self.body_arrays = BodyArrays(self.nb)
+        for j, body in enumerate(self.bodies):
+            body.bind(self.body_arrays, j)
+
         self.g_acc = np.zeros((3, 1))
 
+        self.use_sparse = self.nb >= SPARSE_MIN_BODIES
+
         self.is_initialized = False
 
         # Set solver parameters
@@ -33,14 +51,27 @@ class SystemRA_half:
         self.max_iters = 100
         self.k = 0
 
-        # Set physical quantities
-        self.M = np.zeros((3*self.nb, 3*self.nb))
-        self.J = np.zeros((3*self.nb, 3*self.nb))
-        
-        self.M_inv = np.zeros((3*self.nb, 3*self.nb))
-        self.J_inv = np.zeros((3*self.nb, 3*self.nb))
+        # The factored Schur complement can be reused across steps (quasi-Newton) until it has been used for
+        # refactor_steps steps, the last step needed more than refactor_iters iterations, or Φ_r and Π drifted by more
+        # than refactor_rtol. Reuse costs extra iterations, which only pays off when factoring dominates, so by
+        # default we refactor every step
+        self.refactor_steps = 1
+        self.refactor_iters = 6
+        self.refactor_rtol = 1e-2
+        self.S_age = None
+
+        # Set physical quantities, M and J are block-diagonal so we only keep the diagonal and the 3x3 blocks
+        self.M_diag = np.zeros((3*self.nb, 1))
+        self.J_blocks = np.zeros((self.nb, 3, 3))
+
+        self.M_inv_diag = np.zeros((3*self.nb, 1))
+        self.J_inv_blocks = np.zeros((self.nb, 3, 3))
         
-        self.F_ext = np.zeros((3*self.nb, 1))
+        # External force on each body for the current step: the bodies' own F plus whatever apply_external_force
+        # added for this step. F_ext is the stacked (3nb, 1) view of the same buffer
+        self.F_ext_soa = np.zeros((self.nb, 3, 1))
+        self.F_ext = self.F_ext_soa.reshape(-1, 1)
+        self.F_applied = np.zeros((self.nb, 3, 1))
         self.τ = np.zeros((3*self.nb, 1))
 
         # consraints and their jacobians, make sure dimension matches ....
@@ -53,6 +84,9 @@ class SystemRA_half:
         # lagrange multipliers
         self.λ = np.zeros((self.nc, 1))
         self.λ_hat = np.zeros((self.nc, 1))
+
+        # Kinematics: factorization of Φq at the end of the last step
+        self.Φq_lu = None
                 
 
     def set_dynamics(self):
@@ -81,16 +115,21 @@ class SystemRA_half:
 
     def initialize(self):
 
-        for body in self.bodies:
-            body.F += body.m * self.g_acc
+        bodies = self.body_arrays
 
-        self.M = np.diagflat([[body.m] * 3 for body in self.bodies])
-        self.J = block_mat([body.J for body in self.bodies])
-        
-        self.M_inv = np.diagflat([[1/body.m] * 3 for body in self.bodies])
-        self.J_inv = block_mat([body.J_inv for body in self.bodies])
+        bodies.F += bodies.m[:, None, None] * self.g_acc
+
+        self.M_diag = np.repeat(bodies.m, 3)[:, None]
+        self.J_blocks = bodies.J.copy()
+
+        self.M_inv_diag = 1 / self.M_diag
+        self.J_inv_blocks = np.linalg.inv(self.J_blocks)
+        self.J_inv_sparse = block_diag(self.J_inv_blocks, format='csr')
         
-        self.F_ext = np.vstack([body.F for body in self.bodies])
+        np.add(bodies.F, self.F_applied, out=self.F_ext_soa)
+
+        # Gcon vectors and driving functions are final by now, so hand them to the compiled gcon kernels
+        self.g_cons.pack()
 
         if self.solver_type == SolverType.KINEMATICS:
             if self.nc == 6*self.nb:
@@ -125,26 +164,33 @@ class SystemRA_half:
 
         # Quantities for the right-hand side:
         # Fg is constant, defined above
-        τ = np.vstack([body.get_tau() for body in self.bodies])
+        bodies = self.body_arrays
+        ω_tilde = skew_batched(bodies.ω)
+
+        τ = -np.cross(bodies.ω, bodies.J @ bodies.ω, axis=1).reshape(-1, 1)
         γ = self.g_cons.get_gamma(t_start)
 
-        G_ωω = block_mat([body.get_J_term(self.h) for body in self.bodies])
-        G = np.block([[self.M, np.zeros((3*self.nb, 3*self.nb)), Φ_r.T], [np.zeros((3*self.nb, 3*self.nb)), G_ωω, Π.T],
+        # NOTE: h**2 terms dropped for now, same as Body.get_J_term
+        G_ωω = block_mat(bodies.J - self.h*(skew_batched(bodies.J @ bodies.ω) - ω_tilde @ bodies.J + bodies.n_ω))
+        G = np.block([[np.diagflat(self.M_diag), np.zeros((3*self.nb, 3*self.nb)), Φ_r.T], [np.zeros((3*self.nb, 3*self.nb)), G_ωω, Π.T],
                       [Φ_r, Π, np.zeros((self.nc, self.nc))]])
 
         g = np.block([[self.F_ext], [τ], [γ]])
 
         z = np.linalg.solve(G, g)
 
-        for i, body in enumerate(self.bodies):
-            body.ddr = z[3*i:3*(i+1)]
-            body.dω = z[3*self.nb + 3*i:3*self.nb + 3*(i+1)]
+        bodies.ddr[:] = z[:3*self.nb].reshape(-1, 3, 1)
+        bodies.dω[:] = z[3*self.nb:6*self.nb].reshape(-1, 3, 1)
 
-            body.cache_rA_values()
+        bodies.cache_rA_values()
 
         self.λ = z[6*self.nb:]
         self.λ_hat = self.λ * self.h**2
 
+        # Newton residual e = [e0, e1, e2] and correction δ = [δr, δθ, δλ], written in place every iteration
+        self._e_buf = np.empty((6*self.nb + self.nc, 1))
+        self._δ_buf = np.empty((6*self.nb + self.nc, 1))
+
     def do_step(self, i, t):
         if self.solver_type == SolverType.KINEMATICS:
             self.do_kinematics_step(t)
@@ -155,80 +201,82 @@ class SystemRA_half:
         
         assert self.is_initialized, "Cannot dyn_step before system initialization"
 
+        bodies = self.body_arrays
+
+        # Forces from apply_external_force only act on the step they were applied for
+        np.add(bodies.F, self.F_applied, out=self.F_ext_soa)
+        self.F_applied[:] = 0
+
         if i == 0:
             return
 
         self.g_cons.maybe_swap_gcons(t)
-        
-        
-        self.F_ext = self.F_ext + np.vstack([body.F for body in self.bodies])
 
 
         # this is where friction force should go 
 
-        Phi_r_old = self.g_cons.get_phi_r(t)
-        Pi_old = self.g_cons.get_pi(t)
+        if self.use_sparse:
+            Phi_r_old = self.g_cons.get_phi_r_sparse(t)
+            Pi_old = self.g_cons.get_pi_sparse(t)
+            Phi_r_T, Pi_T = Phi_r_old.T.tocsr(), Pi_old.T.tocsr()
+        else:
+            Phi_r_old = self.g_cons.get_phi_r(t)
+            Pi_old = self.g_cons.get_pi(t)
+            # Φ_rᵀ and Πᵀ are applied to λ̂ every iteration, so lay them out contiguously once per step
+            Phi_r_T, Pi_T = np.ascontiguousarray(Phi_r_old.T), np.ascontiguousarray(Pi_old.T)
         
 
-        solver_r = np.zeros((3*self.nb, 1))
-        solver_dr = np.zeros((3*self.nb, 1))
-        solver_cn = np.zeros((3*self.nb, 1))
-        solver_bn = np.zeros((3*self.nb, 1))
-        solver_theta_bar = np.zeros((3*self.nb, 1))
-
-        for body in self.bodies:
-            body.cache_rA_values() #r_prev, dr_prev, A_prev and ω_prev are assigned
+        bodies.cache_rA_values() #r_prev, dr_prev, A_prev and ω_prev are assigned
             
         # populate r_prev and dr_prev array for the system    
-        for j, body in enumerate(self.bodies):
-            solver_r[3*j:3*(j+1)] = body.r_prev
-            solver_dr[3*j:3*(j+1)] = body.dr_prev     
-            J_term = skew(body.ω_prev) @ body.J @ body.ω_prev
-            solver_cn[3*j:3*(j+1)] = self.h**2 * (J_term - body.n_ω) - self.h * body.J @ body.ω_prev        
+        solver_r = bodies.r_prev.reshape(-1, 1).copy()
+        solver_dr = bodies.dr_prev.reshape(-1, 1)
+        # skew(ω) J ω is ω × (J ω), computed for all bodies at once
+        ω_prev = bodies.ω_prev[:, :, 0]
+        J_ω = np.einsum('bij,bj->bi', self.J_blocks, ω_prev)
+        solver_cn = (self.h**2 * (np.cross(ω_prev, J_ω) - bodies.n_ω[:, :, 0]) - self.h * J_ω).reshape(-1, 1)
         # assemble bn values
-        solver_bn = -(self.M @ solver_r + self.h * self.M @ solver_dr + self.h ** 2 * self.F_ext)
+        solver_bn = -(self.M_diag * solver_r + self.h * self.M_diag * solver_dr + self.h ** 2 * self.F_ext)
         
         
         
         # initial guess of the iterative values
-        for j, body in enumerate(self.bodies):
-            body.r = body.r_prev + self.h * body.dr_prev + self.h**2 * body.ddr
-            body.ω = body.ω_prev + self.h * body.dω
-            body.A = body.A_prev @ exp(self.h * skew(body.ω))            
-            solver_r[3*j:3*(j+1)] = body.r
-            solver_theta_bar[3*j:3*(j+1)] = body.ω * self.h
+        bodies.r[:] = bodies.r_prev + self.h * bodies.dr_prev + self.h**2 * bodies.ddr
+        bodies.ω[:] = bodies.ω_prev + self.h * bodies.dω
+        np.matmul(bodies.A_prev, rodrigues_batch(self.h * bodies.ω), out=bodies.A)
+        solver_r = bodies.r.reshape(-1, 1).copy()
+        solver_theta_bar = bodies.ω.reshape(-1, 1) * self.h
             
 
-        # quasi Newton jacobian
-        G = np.block([[self.M, np.zeros((3*self.nb, 3*self.nb)), Phi_r_old.T],
-                          [np.zeros((3*self.nb, 3*self.nb)), self.J, Pi_old.T],
-                          [Phi_r_old, Pi_old, np.zeros((self.nc, self.nc))]])
-
+        # quasi Newton jacobian, only refactored once the one we have is stale
+        if self.schur_is_stale(Phi_r_old, Pi_old):
+            self.factor_schur(Phi_r_old, Pi_old)
+        self.S_age += 1
 
-        G_lu = lu_factor(G)
 
         # Setup and do Newton-Raphson Iteration
         self.k = 0
-        lambda_old = np.array(self.λ_hat)
-        # lambda_old = self.λ_hat
+        tol_sq = self.tol**2
+
+        # The first step still iterates on λ̂ so that r and θ̄ converge, but its λ̂ is thrown away afterwards. λ̂ is
+        # updated in place, so that is the only step that needs a copy of the old one
+        lambda_old = self.λ_hat.copy() if i == 1 else None
 
         while True:
             
             # solving for current r theta_bar and previous lambda_hat
-            # Form right hand side e matrix g = [e0, e1, e2]
-            e0 = self.M @ solver_r + Phi_r_old.T @ self.λ_hat + solver_bn
-            e1 = self.J @ solver_theta_bar + Pi_old.T @ self.λ_hat + solver_cn
             e2 = self.g_cons.get_phi(t)
-            e = np.block([[e0], [e1], [e2]])
-                        
 
-            δ = lu_solve(G_lu, -e)
-            
-            solver_r += δ[0:3*self.nb]
-            solver_theta_bar += δ[3*self.nb:6*self.nb]
-                                  
-            # do not update lambda when iteration i = 1
-            self.λ_hat += δ[6*self.nb: len(δ)]
+            # Form right hand side e = [e0, e1, e2], solve G δ = -e and move r, theta_bar, lambda_hat and the bodies
+            # to the new iterate
+            if self.use_sparse:
+                δ_sq = self.newton_update_sparse(Phi_r_T, Pi_T, solver_r, solver_theta_bar, solver_bn, solver_cn,
+                                                   e2)
+            else:
+                δ_sq = _newton_update(self.h, self.M_diag, self.M_inv_diag, self.J_blocks, self.J_inv_blocks,
+                                        Phi_r_T, Pi_T, self.Phi_r_S_T, self.Pi_S_T, self.Phi_r_M_inv, self.Pi_J_inv,
+                                        *self.S_fac, solver_r, solver_theta_bar, self.λ_hat, solver_bn, solver_cn, e2,
+                                        bodies.A_prev, bodies.r, bodies.ω, bodies.A, self._e_buf, self._δ_buf)
                         
             # logging.debug('t: {:.3f}, k: {:>2d}, norm: {:6.6e}'.format(
             #     t, self.k, np.linalg.norm(δ)))
@@ -236,93 +284,173 @@ class SystemRA_half:
             # print("itr %d, correction: lambda: %.5E %.5E %.5E" % (self.k, δ[len(δ)-1]/self.h**2, δ[len(δ)-2]/self.h**2, δ[len(δ)-3]/self.h**2))
             # print("step %d, itr %d, |dλ| %.5E" % (i, self.k, np.linalg.norm(δ[6*self.nb:])/(self.h**2)))
 
-            if np.linalg.norm(δ) < self.tol:            
+            if δ_sq < tol_sq:
                 break
             
-            # try this 
-            for j, body in enumerate(self.bodies):
-                body.r = solver_r[3*j:3*(j+1), :]
-                body.ω = solver_theta_bar[3*j: 3*(j+1), :]/self.h
-                body.A = body.A_prev @ exp(self.h * skew(body.ω))
-            
             if self.k >= self.max_iters:
             # temporarily disable this for the purpose of debugging
                 raise RuntimeError(
                     'Newton-Raphson not converging at t: {:.3f}, k: {:>2d}'.format(t, self.max_iters))
-            
 
-        # update r omega and A of each body since we found the solution
-        for j, body in enumerate(self.bodies):
-            body.r = solver_r[3*j:3*(j+1), :]
-            body.ω = solver_theta_bar[3*j: 3*(j+1), :]/self.h
-            body.A = body.A_prev @ exp(self.h * skew(body.ω))
 
-        if i == 1:
+        # r omega and A of each body were already moved to the solution by the last update
+        if lambda_old is not None:
             self.λ_hat = lambda_old
 
         self.update_ddr(Phi_r_old)
         self.update_dω(Pi_old)
         
+    def schur_is_stale(self, Phi_r, Pi):
+        """
+        Checks whether the factored Schur complement should be rebuilt from the Jacobians at the current step
+        """
+        if self.S_age is None or self.S_age >= self.refactor_steps or self.k > self.refactor_iters:
+            return True
+
+        mat_norm = sparse_norm if issparse(Phi_r) else np.linalg.norm
+        drift = mat_norm(Phi_r - self.Phi_r_S) + mat_norm(Pi - self.Pi_S)
+        return drift > self.refactor_rtol * (mat_norm(self.Phi_r_S) + mat_norm(self.Pi_S))
+
+    def factor_schur(self, Phi_r, Pi):
+        """
+        G = [[M, 0, Φ_rᵀ], [0, J, Πᵀ], [Φ_r, Π, 0]], but M and J are block-diagonal. So we eliminate δr and δθ and
+        only factor the Schur complement S = Φ_r M⁻¹ Φ_rᵀ + Π J⁻¹ Πᵀ, keeping the pieces needed to back-substitute
+        """
+        # ConGroup hands out the same dense buffers every call, so hold on to copies
+        self.Phi_r_S = Phi_r.copy()
+        self.Pi_S = Pi.copy()
+
+        if self.use_sparse:
+            self.Phi_r_M_inv = self.Phi_r_S.multiply(self.M_inv_diag.T).tocsr()
+            self.Pi_J_inv = self.Pi_S @ self.J_inv_sparse
+            self.Phi_r_S_T, self.Pi_S_T = self.Phi_r_S.T.tocsr(), self.Pi_S.T.tocsr()
+            S = self.Phi_r_M_inv @ self.Phi_r_S_T + self.Pi_J_inv @ self.Pi_S_T
+
+            self.S_splu = splu(S.tocsc())
+        else:
+            self.Phi_r_M_inv = self.Phi_r_S * self.M_inv_diag.T
+            self.Pi_J_inv = self.J_inv_mul_rows(self.Pi_S)
+            self.Phi_r_S_T, self.Pi_S_T = np.ascontiguousarray(self.Phi_r_S.T), np.ascontiguousarray(self.Pi_S.T)
+            S = self.Phi_r_M_inv @ self.Phi_r_S_T + self.Pi_J_inv @ self.Pi_S_T
+
+            # S is symmetric positive definite unless the gcons are redundant, in which case we fall back to LU
+            L, info = dpotrf(S, lower=1, clean=0, overwrite_a=0)
+            self.S_fac = (L, _NO_PIVOTS) if info == 0 else _getrf(S)
+
+        self.S_age = 0
+
+    def newton_update_sparse(self, Phi_r_T, Pi_T, solver_r, solver_theta_bar, solver_bn, solver_cn, e2):
+        """
+        Same as _newton_update, but for the scipy.sparse Jacobians used on large systems
+        """
+        n = 3*self.nb
+        e0, e1 = self._e_buf[:n], self._e_buf[n:2*n]
+        δr, δθ, δλ = self._δ_buf[:n], self._δ_buf[n:2*n], self._δ_buf[2*n:]
+
+        np.multiply(self.M_diag, solver_r, out=e0)
+        e0 += Phi_r_T @ self.λ_hat
+        e0 += solver_bn
+        e1[:] = self.J_mul(solver_theta_bar)
+        e1 += Pi_T @ self.λ_hat
+        e1 += solver_cn
+
+        # solve G δ = -e through the Schur complement, then back-substitute for δr and δθ
+        δλ[:] = self.S_splu.solve(e2 - self.Phi_r_M_inv @ e0 - self.Pi_J_inv @ e1)
+        e0 += self.Phi_r_S_T @ δλ
+        np.multiply(self.M_inv_diag, e0, out=δr)
+        np.negative(δr, out=δr)
+        e1 += self.Pi_S_T @ δλ
+        δθ[:] = -self.J_inv_mul(e1)
+
+        solver_r += δr
+        solver_theta_bar += δθ
+        self.λ_hat += δλ
+
+        bodies = self.body_arrays
+        _update_bodies(self.h, solver_r, solver_theta_bar, bodies.A_prev, bodies.r, bodies.ω, bodies.A)
+
+        δ = self._δ_buf.ravel()
+        return δ @ δ
+
+    def J_mul(self, v):
+        """
+        Computes J @ v for a stacked (3nb, 1) vector using only the (nb, 3, 3) diagonal blocks of J
+        """
+        return np.einsum('bij,bj->bi', self.J_blocks, v.reshape(self.nb, 3)).reshape(-1, 1)
+
+    def J_inv_mul(self, v):
+        """
+        Computes J⁻¹ @ v for a stacked (3nb, 1) vector using only the (nb, 3, 3) diagonal blocks of J⁻¹
+        """
+        return np.einsum('bij,bj->bi', self.J_inv_blocks, v.reshape(self.nb, 3)).reshape(-1, 1)
+
+    def J_inv_mul_rows(self, mat):
+        """
+        Computes mat @ J⁻¹ for a (k, 3nb) matrix using only the (nb, 3, 3) diagonal blocks of J⁻¹
+        """
+        k = mat.shape[0]
+        return np.einsum('kbi,bij->kbj', mat.reshape(k, self.nb, 3), self.J_inv_blocks).reshape(k, -1)
+
     # update ddr and dr
     def update_ddr(self, Phi_r_old):
         self.λ = self.λ_hat / (self.h **2)
         sumF = self.F_ext - Phi_r_old.T @ self.λ
-        for j, body in enumerate(self.bodies):
-            body.ddr = np.diagflat([1/body.m] * 3) @ sumF[3*j:3*(j+1), :]
-            body.dr = body.dr + self.h*body.ddr
+        bodies = self.body_arrays
+        bodies.ddr[:] = (self.M_inv_diag * sumF).reshape(-1, 3, 1)
+        bodies.dr += self.h*bodies.ddr
 
     def update_dω(self, Pi_old):
-        sumTrq = -Pi_old.T @ self.λ;
-        for j, body in enumerate(self.bodies):
-            body.dω = body.J_inv @ ( sumTrq[3*j:3*(j+1), :] + skew(body.ω) @ body.J @ body.ω)
+        sumTrq = -Pi_old.T @ self.λ
+        bodies = self.body_arrays
+        bodies.dω[:] = bodies.J_inv @ (sumTrq.reshape(-1, 3, 1) + np.cross(bodies.ω, bodies.J @ bodies.ω, axis=1))
 
 
     def do_kinematics_step(self, t):
 
-        self.g_cons.maybe_swap_gcons(t)
+        swapped = self.g_cons.maybe_swap_gcons(t)
 
-        # Refresh the inverse matrix with our new positions
-        self.Φq = self.g_cons.get_phi_q(t)
-        Φq_lu = lu_factor(self.Φq)
+        bodies = self.body_arrays
+
+        # The bodies have not moved since the end of the last step, so the Φq factored there is still current unless a
+        # gcon was swapped in the meantime
+        if self.Φq_lu is None or swapped:
+            self.Φq = self.g_cons.get_phi_q(t)
+            self.Φq_lu = _getrf(self.Φq)
+        Φq_lu = self.Φq_lu
 
         self.k = 0
+        tol_sq = self.tol**2
         while True:
             self.Φ = self.g_cons.get_phi(t)
 
-            Δq = lu_solve(Φq_lu, -self.Φ)
+            Δq = _getrs(Φq_lu, -self.Φ)
 
-            for j, body in enumerate(self.bodies):
-                Δr = Δq[3*j:3*(j+1)]
-                Δθ = Δq[3*(self.nb + j):3*(self.nb + j+1)]
-                Δθ_mag = np.linalg.norm(Δθ)
-
-                body.r = body.r + Δr
-                if Δθ_mag != 0:
-                    body.A = body.A @ R(Δθ/Δθ_mag, Δθ_mag)
+            bodies.r += Δq[:3*self.nb].reshape(-1, 3, 1)
+            bodies.A[:] = bodies.A @ rodrigues_batch(Δq[3*self.nb:].reshape(-1, 3, 1))
 
             self.k += 1
 
             # logging.debug('t: {:.3f}, k: {:>2d}, norm: {:6.6e}'.format(t, self.k, np.linalg.norm(Δq)))
 
-            if np.linalg.norm(Δq) < self.tol:
+            Δq_flat = Δq.ravel()
+            if Δq_flat @ Δq_flat < tol_sq:
                 break
 
             if self.k >= self.max_iters:
                 raise RuntimeError(
                     'Newton-Raphson not converging at t: {:.3f}, k: {:>2d}'.format(t, self.max_iters))
 
+        # Refresh the inverse matrix with our new positions, this factorization is reused by the next step's iteration
         self.Φq = self.g_cons.get_phi_q(t)
-        Φq_lu = lu_factor(self.Φq)
+        self.Φq_lu = Φq_lu = _getrf(self.Φq)
 
-        dq = lu_solve(Φq_lu, self.g_cons.get_nu(t))
-        for j, body in enumerate(self.bodies):
-            body.dr = dq[3*j:3*(j+1), :]
-            body.ω = dq[3*(self.nb + j):3*(self.nb + j+1), :]
+        dq = _getrs(Φq_lu, self.g_cons.get_nu(t))
+        bodies.dr[:] = dq[:3*self.nb].reshape(-1, 3, 1)
+        bodies.ω[:] = dq[3*self.nb:].reshape(-1, 3, 1)
 
-        ddq = lu_solve(Φq_lu, self.g_cons.get_gamma(t))
-        for j, body in enumerate(self.bodies):
-            body.ddr = ddq[3*j:3*(j+1), :]
-            body.dω = ddq[3*(self.nb + j):3*(self.nb + j+1), :]
+        ddq = _getrs(Φq_lu, self.g_cons.get_gamma(t))
+        bodies.ddr[:] = ddq[:3*self.nb].reshape(-1, 3, 1)
+        bodies.dω[:] = ddq[3*self.nb:].reshape(-1, 3, 1)
             
             
     def compute_reaction_forces(self, t):
@@ -348,11 +476,183 @@ class SystemRA_half:
         return Pi_old[nc_id, 3*(body_id) + idx] * self.λ[nc_id]
     
     def apply_external_force(self, body_id, F):
-        self.F_ext = np.zeros((3*self.nb, 1))
-        self.F_ext[3*body_id:3*body_id+3] += F 
+        """Adds F to body body_id for the next step only, on top of its own F"""
+        self.F_applied[body_id] += F.reshape(3, 1)
     
 
 
+def _getrf(a):
+    """
+    scipy.linalg.lu_factor without the argument checking, which is a noticeable part of the cost for the small dense
+    systems factored every step. The matrix must be finite, the result is the same (lu, piv) pair
+    """
+    lu, piv, info = dgetrf(a)
+    if info > 0:
+        warnings.warn('Diagonal number {} is exactly zero. Singular matrix.'.format(info), LinAlgWarning, stacklevel=2)
+    return lu, piv
+
+
+def _getrs(lu_piv, b):
+    """
+    scipy.linalg.lu_solve straight through LAPACK, for a factorization from _getrf. b is left untouched
+    """
+    x, _ = dgetrs(*lu_piv, b)
+    return x
+
+
+@njit(cache=True)
+def _newton_update(h, M_diag, M_inv_diag, J_blocks, J_inv_blocks, Φ_r_T, Π_T, Φ_r_S_T, Π_S_T, Φ_r_M_inv, Π_J_inv, S_fac,
+                   S_piv, r, θ_bar, λ_hat, bn, cn, Φ, A_prev, body_r, body_ω, body_A, e, δ):
+    """
+    One quasi-Newton iteration of do_dynamics_step on dense Jacobians. Forms e = [e0, e1, e2], solves G δ = -e through
+    the factored Schur complement (Cholesky if S_piv is empty, LU otherwise), applies δ to r, θ_bar and λ_hat in place and writes the new iterate to the body
+    arrays. e and δ are preallocated (6nb + nc, 1) buffers. Returns |δ|², the convergence check compares it to tol² and skips the sqrt
+    """
+    nb = J_blocks.shape[0]
+    nc = Φ.shape[0]
+    n = 3*nb
+
+    # e0 = M r + Φ_rᵀ λ̂ + bn, e1 = J θ̄ + Πᵀ λ̂ + cn
+    _blocks_mul(J_blocks, θ_bar, 0, e, n)
+    for j in range(n):
+        e[j, 0] = M_diag[j, 0]*r[j, 0] + bn[j, 0]
+        e[n + j, 0] += cn[j, 0]
+        for c in range(nc):
+            e[j, 0] += Φ_r_T[j, c]*λ_hat[c, 0]
+            e[n + j, 0] += Π_T[j, c]*λ_hat[c, 0]
+
+    # S δλ = e2 - Φ_r M⁻¹ e0 - Π J⁻¹ e1
+    for c in range(nc):
+        rhs = Φ[c, 0]
+        for j in range(n):
+            rhs -= Φ_r_M_inv[c, j]*e[j, 0] + Π_J_inv[c, j]*e[n + j, 0]
+        δ[2*n + c, 0] = rhs
+    if S_piv.shape[0] == 0:
+        _cho_solve(S_fac, δ, 2*n)
+    else:
+        _lu_solve(S_fac, S_piv, δ, 2*n)
+
+    # δr = -M⁻¹ (e0 + Φ_rᵀ δλ), δθ = -J⁻¹ (e1 + Πᵀ δλ)
+    for j in range(n):
+        for c in range(nc):
+            e[j, 0] += Φ_r_S_T[j, c]*δ[2*n + c, 0]
+            e[n + j, 0] += Π_S_T[j, c]*δ[2*n + c, 0]
+        δ[j, 0] = -M_inv_diag[j, 0]*e[j, 0]
+    _blocks_mul(J_inv_blocks, e, n, δ, n)
+
+    δ_sq = 0.0
+    for j in range(n):
+        δ[n + j, 0] = -δ[n + j, 0]
+        r[j, 0] += δ[j, 0]
+        θ_bar[j, 0] += δ[n + j, 0]
+        δ_sq += δ[j, 0]**2 + δ[n + j, 0]**2
+    for c in range(nc):
+        λ_hat[c, 0] += δ[2*n + c, 0]
+        δ_sq += δ[2*n + c, 0]**2
+
+    # Too few bodies here for _update_bodies' threads to pay off
+    for b in range(nb):
+        for m in range(3):
+            body_r[b, m, 0] = r[3*b + m, 0]
+            body_ω[b, m, 0] = θ_bar[3*b + m, 0] / h
+        body_A[b] = A_prev[b] @ _rodrigues(h*body_ω[b])
+
+    return δ_sq
+
+
+@njit(parallel=True, cache=True)
+def _update_bodies(h, r, θ_bar, A_prev, body_r, body_ω, body_A):
+    """
+    Writes the Newton iterate r, θ_bar to the body arrays. Every body is independent, so they are split across threads
+    """
+    for b in prange(A_prev.shape[0]):
+        for m in range(3):
+            body_r[b, m, 0] = r[3*b + m, 0]
+            body_ω[b, m, 0] = θ_bar[3*b + m, 0] / h
+        body_A[b] = A_prev[b] @ _rodrigues(h*body_ω[b])
+
+
+@njit(cache=True)
+def _blocks_mul(blocks, v, v_start, out, out_start):
+    """
+    Multiplies the block-diagonal matrix given by its (nb, 3, 3) blocks with the stacked 3nb vector starting at row
+    v_start of v, writing the result from row out_start of out
+    """
+    for b in range(blocks.shape[0]):
+        for m in range(3):
+            out[out_start + 3*b + m, 0] = (blocks[b, m, 0]*v[v_start + 3*b, 0] + blocks[b, m, 1]*v[v_start + 3*b + 1, 0]
+                                           + blocks[b, m, 2]*v[v_start + 3*b + 2, 0])
+
+
+@njit(cache=True)
+def _lu_solve(lu, piv, x, start):
+    """
+    In-place lu_solve for a factorization from scipy.linalg.lu_factor (LAPACK getrf layout), the right hand side sits
+    in x from row start on. Stays in nopython mode
+    """
+    n = lu.shape[0]
+
+    for i in range(n):
+        p = piv[i]
+        if p != i:
+            x[start + i, 0], x[start + p, 0] = x[start + p, 0], x[start + i, 0]
+
+    # L has a unit diagonal, U sits on and above the diagonal
+    for i in range(n):
+        for j in range(i):
+            x[start + i, 0] -= lu[i, j]*x[start + j, 0]
+
+    for i in range(n - 1, -1, -1):
+        for j in range(i + 1, n):
+            x[start + i, 0] -= lu[i, j]*x[start + j, 0]
+        x[start + i, 0] /= lu[i, i]
+
+
+@njit(cache=True)
+def _cho_solve(L, x, start):
+    """
+    In-place cho_solve for the lower Cholesky factor L from LAPACK potrf (only the lower triangle is read), the right
+    hand side sits in x from row start on
+    """
+    n = L.shape[0]
+
+    for i in range(n):
+        for j in range(i):
+            x[start + i, 0] -= L[i, j]*x[start + j, 0]
+        x[start + i, 0] /= L[i, i]
+
+    for i in range(n - 1, -1, -1):
+        for j in range(i + 1, n):
+            x[start + i, 0] -= L[j, i]*x[start + j, 0]
+        x[start + i, 0] /= L[i, i]
+
+
+@njit(cache=True)
+def _rodrigues(v):
+    """
+    exp(skew(v)) for a single (3, 1) rotation vector, see utils.physics.rodrigues_batch
+    """
+    θ = np.sqrt(v[0, 0]**2 + v[1, 0]**2 + v[2, 0]**2)
+    rot = np.eye(3)
+    if θ == 0:
+        return rot
+
+    u = v / θ
+    c = np.cos(θ)
+    s = np.sin(θ)
+    for m in range(3):
+        for n in range(3):
+            rot[m, n] = c*rot[m, n] + (1 - c)*u[m, 0]*u[n, 0]
+    rot[0, 1] -= s*u[2, 0]
+    rot[0, 2] += s*u[1, 0]
+    rot[1, 0] += s*u[2, 0]
+    rot[1, 2] -= s*u[0, 0]
+    rot[2, 0] -= s*u[1, 0]
+    rot[2, 1] += s*u[0, 0]
+
+    return rot
+
+
 def create_constraint_from_bodies(json_con, all_bodies):
     """
     Reads from all_bodies to call create_constraint with appropriate args
@@ -116,6 +116,23 @@ def skew(v):
     return np.array([[0, -v[2, 0], v[1, 0]], [v[2, 0], 0, -v[0, 0]], [-v[1, 0], v[0, 0], 0]])
 
 
+def skew_batched(v):
+    """
+    skew for a stack of column vectors, takes v with shape (k, 3, 1) and returns the k cross product matrices as a
+    (k, 3, 3) array
+    """
+    ṽ = np.zeros((v.shape[0], 3, 3))
+
+    ṽ[:, 0, 1] = -v[:, 2, 0]
+    ṽ[:, 0, 2] = v[:, 1, 0]
+    ṽ[:, 1, 0] = v[:, 2, 0]
+    ṽ[:, 1, 2] = -v[:, 0, 0]
+    ṽ[:, 2, 0] = -v[:, 1, 0]
+    ṽ[:, 2, 1] = v[:, 0, 0]
+
+    return ṽ
+
+
 def A(p):
     """
     Computes a rotation matrix (A) from a given orientation vector (unit quaternion) p. Expects a column vector but will
@@ -218,6 +235,23 @@ def exp(mat):
     return R(v/v_norm, v_norm)
 
 
+def rodrigues_batch(v):
+    """
+    Batched exp(skew(v)), takes a stack of rotation vectors with shape (k, 3, 1) and applies the Rodrigues formula to
+    each, returning a (k, 3, 3) stack of rotation matrices
+    """
+    θ = np.linalg.norm(v, axis=(1, 2))[:, None, None]
+
+    # sin(θ)/θ and (1 - cos(θ))/θ² from their Taylor series near 0, where the closed forms lose all precision
+    small = θ < 1e-6
+    θ_safe = np.where(small, 1, θ)
+    cos_θ = np.cos(θ)
+    sin_c = np.where(small, 1 - θ**2/6, np.sin(θ) / θ_safe)
+    cos_c = np.where(small, 1/2 - θ**2/24, (1 - cos_θ) / θ_safe**2)
+
+    return cos_θ*I3 + cos_c*(v @ v.transpose(0, 2, 1)) + sin_c*skew_batched(v)
+
+
 def rodrigues_rot(v, k, θ):
     """
     Uses Rodrigues' rotation formula to rotate a vector v by θ about the unit vector axis k
@@ -279,14 +313,14 @@ def block_mat(lst):
     Takes a list (of len k) of (m x n) matrices and assembles a (km x kn) block matrix with the matrices on the diagonal
     """
 
-    m, n = np.shape(lst[0])
-    k = len(lst)
+    blocks = np.asarray(lst)
+    k, m, n = blocks.shape
 
-    ret = np.zeros((m*k, n*k))
-    for i, mat in enumerate(lst):
-        ret[m*i:m*(i+1), n*i:n*(i+1)] = mat
+    # Index as (block row, row, block col, col) so that the diagonal blocks can be written all at once
+    ret = np.zeros((k, m, k, n))
+    ret[np.arange(k), :, np.arange(k), :] = blocks
 
-    return ret
+    return ret.reshape((m*k, n*k))
 
 
 def generate_sympy_constraint(f_sym, var):